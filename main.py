@@ -1,9 +1,22 @@
+import asyncio
+import json
+import logging
+import re
+import requests
 import streamlit as st
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from crewai import Agent, Crew, Task
 from crewai_tools import ScrapeWebsiteTool, SerperDevTool
-from pydantic import BaseModel
+from http.cookiejar import DefaultCookiePolicy
+from pydantic.fields import PrivateAttr
+from pydantic.main import BaseModel
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import msgspec
+import orjson
 import os
-import json
 
 
 # --- Data Models ---
@@ -20,48 +33,229 @@ class MarketingReport(BaseModel):
     estimated_reach: int
 
 
+# Read-side mirrors of the models above. output_json already validates the agent
+# output when the file is written, so rendering never rebuilds pydantic models.
+class VenueRecord(msgspec.Struct):
+    name: str
+    address: str
+    capacity: int
+    booking_status: str
+
+
+class MarketingRecord(msgspec.Struct):
+    summary: str
+    campaigns: list[str]
+    estimated_reach: int
+
+
+# --- Result Files ---
+def encode_result(output):
+    # Indented once here so the download buttons can serve the bytes as-is.
+    # Unconvertible output is kept raw, as CrewAI's output_file did.
+    if output.json_dict is None:
+        return output.raw.encode()
+    return orjson.dumps(output.json_dict, option=orjson.OPT_INDENT_2)
+
+
+# Upper bound on crews running at once; one per agent by default.
+MAX_PARALLEL_AGENTS = 3
+
+
+# --- Input Patterns ---
+INT_RE = re.compile(r"\d+")
+# Plain decimals as float() reads them, signs included; no nan, inf or exponents.
+NUMBER_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)")
+
+# --- Task Templates ---
+# Filled from event_details with str.format_map on submit.
+VENUE_TASK_TEMPLATE = (
+    "Find a venue in {event_city} suitable for hosting a {event_topic}. "
+    "The venue must support at least {expected_participants} participants, "
+    "stay within the budget of {budget}, be available on {tentative_date}, and have appropriate tech facilities. "
+    "Return only one most suitable venue as structured JSON."
+)
+
+LOGISTICS_TASK_TEMPLATE = (
+    "Arrange catering and equipment for an event happening on {tentative_date} with "
+    "{expected_participants} participants. Ensure all logistics are confirmed and documented."
+)
+
+MARKETING_TASK_TEMPLATE = (
+    "Plan a marketing campaign to promote the {event_topic} in {event_city} aiming to reach at least "
+    "{expected_participants} people. Suggest at least 3 channels (e.g., Facebook, local radio, WhatsApp groups)."
+)
+
+
+# --- Parallel Crew Execution ---
+async def run_task(agent, task, inputs, semaphore):
+    async with semaphore:
+        return await Crew(agents=[agent], tasks=[task]).kickoff_async(inputs=inputs)
+
+
+async def run_crews(assignments, inputs):
+    # The tasks share no outputs, so each gets its own crew and they run side by side.
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_AGENTS)
+    return await asyncio.gather(
+        *(run_task(agent, task, inputs, semaphore) for agent, task in assignments)
+    )
+
+
+# --- Background Planning ---
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=32)
+def cached_plan(_assignments, inputs):
+    # Identical submissions replay the earlier run instead of calling the LLMs again.
+    venue, logistics, marketing = asyncio.run(run_crews(_assignments, inputs))
+    # Taken from this run's own outputs rather than the shared files, which
+    # another session's run may have rewritten in the meantime.
+    files = {
+        "venue_details.json": encode_result(venue),
+        "marketing_report.json": encode_result(marketing),
+    }
+    summaries = [
+        (task.agent, task.description, task.summary)
+        for result in (venue, logistics, marketing)
+        for task in result.tasks_output
+    ]
+    return files, summaries
+
+
+def plan_event(ctx, assignments, inputs):
+    # Attach the submitting session's context so cached helpers work off-thread.
+    add_script_run_ctx(threading.current_thread(), ctx)
+    files, summaries = cached_plan(assignments, inputs)
+    # Sole writer of the on-disk output files, once per run whether or not the
+    # cache hit. The UI renders from the returned bytes, never from these files.
+    for path, raw in files.items():
+        with open(path, "wb") as f:
+            f.write(raw)
+    return files, summaries
+
+
 # --- Sidebar API Config ---
 st.sidebar.title("🔐 API Configuration")
 openai_key = st.sidebar.text_input("OpenAI API Key", type="password")
 serper_key = st.sidebar.text_input("Serper API Key", type="password")
 
 # --- Tools ---
-search_tool = SerperDevTool()
-scrape_tool = ScrapeWebsiteTool()
+logger = logging.getLogger(__name__)
+
+
+def make_http_session():
+    # Keep-alive pool so repeat requests skip the TCP/TLS handshake.
+    session = requests.Session()
+    # Never keep cookies; the session is shared by every user's runs.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Mirrors _make_api_request from crewai-tools 1.15.27 (pinned through
+# crewai[tools] in requirements.txt) line for line, swapping only the
+# module-level requests.post for the tool's pooled session. Page scraping is
+# left to the stock ScrapeWebsiteTool, whose SSRF-checked fetch cannot share
+# a pool.
+class PooledSerperDevTool(SerperDevTool):
+    # Created with the tool inside the cached get_tools(), so CrewAI's worker
+    # threads never go through Streamlit's cache to reach it.
+    _session: requests.Session = PrivateAttr(default_factory=make_http_session)
+
+    def _make_api_request(self, search_query, search_type):
+        search_url = self._get_search_url(search_type)
+        payload = {"q": search_query, "num": self.n_results}
+
+        if self.country != "":
+            payload["gl"] = self.country
+        if self.location != "":
+            payload["location"] = self.location
+        if self.locale != "":
+            payload["hl"] = self.locale
+
+        headers = {
+            "X-API-KEY": os.environ["SERPER_API_KEY"],
+            "content-type": "application/json",
+        }
+
+        response = None
+        try:
+            response = self._session.post(
+                search_url, headers=headers, json=payload, timeout=10
+            )
+            response.raise_for_status()
+            results = response.json()
+            if not results:
+                logger.error("Empty response from Serper API")
+                raise ValueError("Empty response from Serper API")
+            return dict(results)
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Error making request to Serper API: {e}"
+            if response is not None and hasattr(response, "content"):
+                error_msg += f"\nResponse content: {response.content.decode('utf-8', errors='replace')}"
+            logger.error(error_msg)
+            raise
+        except json.JSONDecodeError as e:
+            if response is not None and hasattr(response, "content"):
+                logger.error(f"Error decoding JSON response: {e}")
+                logger.error(
+                    f"Response content: {response.content.decode('utf-8', errors='replace')}"
+                )
+            else:
+                logger.error(
+                    f"Error decoding JSON response: {e} (No response content available)"
+                )
+            raise
+
+
+@st.cache_resource
+def get_tools():
+    return PooledSerperDevTool(), ScrapeWebsiteTool()
+
 
 # --- Agents ---
-venue_cordinator = Agent(
-    role="Venue Coordinator",
-    goal="Find and book the most suitable venue for the event",
-    tools=[search_tool, scrape_tool],
-    verbose=True,
-    backstory=(
-        "You're a logistics genius who can find a perfect venue for any tech event. "
-        "You balance cost, capacity, availability, and quality while ensuring the venue meets the event's needs."
-    ),
-)
+def build_agents(tools):
+    # Built per submit, after the env vars are set, so each run picks up the
+    # configured model and owns its agents' per-run state.
+    search_tool, scrape_tool = tools
+
+    venue_cordinator = Agent(
+        role="Venue Coordinator",
+        goal="Find and book the most suitable venue for the event",
+        tools=[search_tool, scrape_tool],
+        verbose=True,
+        backstory=(
+            "You're a logistics genius who can find a perfect venue for any tech event. "
+            "You balance cost, capacity, availability, and quality while ensuring the venue meets the event's needs."
+        ),
+    )
 
-logistics_manager = Agent(
-    role="Logistics Manager",
-    goal="Handle catering and equipment logistics smoothly",
-    tools=[search_tool, scrape_tool],
-    verbose=True,
-    backstory="You manage catering and technical setup with efficiency and precision.",
-)
+    logistics_manager = Agent(
+        role="Logistics Manager",
+        goal="Handle catering and equipment logistics smoothly",
+        tools=[search_tool, scrape_tool],
+        verbose=True,
+        backstory="You manage catering and technical setup with efficiency and precision.",
+    )
+
+    marketing_communications_agent = Agent(
+        role="Marketing and Communications Agent",
+        goal="Promote the event and ensure maximum attendance",
+        tools=[search_tool, scrape_tool],
+        verbose=True,
+        backstory="You excel at designing effective marketing campaigns and reaching the right audience.",
+    )
+
+    return venue_cordinator, logistics_manager, marketing_communications_agent
 
-marketing_communications_agent = Agent(
-    role="Marketing and Communications Agent",
-    goal="Promote the event and ensure maximum attendance",
-    tools=[search_tool, scrape_tool],
-    verbose=True,
-    backstory="You excel at designing effective marketing campaigns and reaching the right audience.",
-)
 
 # --- Main UI ---
 st.title("🎯 Event Management AI Planner")
 
-import streamlit as st
-
 with st.form("event_form"):
     event_topic = st.text_input("Event Topic", value="")
     event_description = st.text_area("Event Description", value="")
@@ -87,7 +281,7 @@ with st.form("event_form"):
         # Validate expected participants
         if expected_participants_input.strip() == "":
             expected_participants = None
-        elif expected_participants_input.isdigit():
+        elif INT_RE.fullmatch(expected_participants_input.strip()):
             expected_participants = int(expected_participants_input)
         else:
             st.error("❌ Expected Participants must be a whole number.")
@@ -96,12 +290,11 @@ with st.form("event_form"):
         # Validate budget
         if budget_input.strip() == "":
             budget = None
+        elif NUMBER_RE.fullmatch(budget_input.strip()):
+            budget = float(budget_input)
         else:
-            try:
-                budget = float(budget_input)
-            except ValueError:
-                st.error("❌ Budget must be a valid number (e.g., 1000 or 1000.50).")
-                errors = True
+            st.error("❌ Budget must be a valid number (e.g., 1000 or 1000.50).")
+            errors = True
 
         # If no validation errors, process the data
         if not errors:
@@ -112,8 +305,11 @@ with st.form("event_form"):
 
 # --- Validation & AI Agent Execution ---
 if submit:
+    planner_future = st.session_state.get("planner_future")
+    if planner_future is not None and not planner_future.done():
+        st.warning("⏳ The AI agents are still working on the previous request.")
     # Validate input fields
-    if not all(
+    elif not all(
         [
             openai_key.strip(),
             serper_key.strip(),
@@ -134,123 +330,125 @@ if submit:
         os.environ["OPENAI_MODEL_NAME"] = "gpt-3.5-turbo"
         os.environ["SERPER_API_KEY"] = serper_key
 
-        st.info("⏳ Running AI Agents...")
+        venue_cordinator, logistics_manager, marketing_communications_agent = (
+            build_agents(get_tools())
+        )
 
         event_details = {
             "event_topic": event_topic,
             "event_description": event_description,
             "event_city": event_city,
-            "tentative_date": tentative_date.strftime("%Y-%m-%d"),
+            "tentative_date": tentative_date.isoformat(),
             "expected_participants": expected_participants,
             "budget": budget,
             "venue_type": venue_type,
         }
 
         venue_task = Task(
-            description=(
-                f"Find a venue in {event_city} suitable for hosting a {event_topic}. "
-                f"The venue must support at least {expected_participants} participants, "
-                f"stay within the budget of {budget}, be available on {tentative_date}, and have appropriate tech facilities. "
-                "Return only one most suitable venue as structured JSON."
-            ),
+            description=VENUE_TASK_TEMPLATE.format_map(event_details),
             expected_output="Return the venue's name, address, capacity, and booking_status.",
             output_json=VenueDetails,
-            output_file="venue_details.json",
             agent=venue_cordinator,
         )
 
         logistics_task = Task(
-            description=(
-                f"Arrange catering and equipment for an event happening on {tentative_date} with "
-                f"{expected_participants} participants. Ensure all logistics are confirmed and documented."
-            ),
+            description=LOGISTICS_TASK_TEMPLATE.format_map(event_details),
             expected_output="Confirmation of all arrangements for food, seating, projectors, mics, and stage setup.",
             agent=logistics_manager,
         )
 
         marketing_task = Task(
-            description=(
-                f"Plan a marketing campaign to promote the {event_topic} in {event_city} aiming to reach at least "
-                f"{expected_participants} people. Suggest at least 3 channels (e.g., Facebook, local radio, WhatsApp groups)."
-            ),
+            description=MARKETING_TASK_TEMPLATE.format_map(event_details),
             expected_output="Return summary, campaign list, and estimated audience reach.",
             output_json=MarketingReport,
-            output_file="marketing_report.json",
             agent=marketing_communications_agent,
         )
 
-        event_management_crew = Crew(
-            agents=[
-                venue_cordinator,
-                logistics_manager,
-                marketing_communications_agent,
+        # Runs off the script thread so reruns neither block on nor re-trigger it.
+        st.session_state["planner_future"] = get_executor().submit(
+            plan_event,
+            get_script_run_ctx(),
+            [
+                (venue_cordinator, venue_task),
+                (logistics_manager, logistics_task),
+                (marketing_communications_agent, marketing_task),
             ],
-            tasks=[venue_task, logistics_task, marketing_task],
+            event_details,
         )
 
-        result = event_management_crew.kickoff(inputs=event_details)
-
-        st.success("🎉 Event Planning Completed")
-        st.markdown("### ✅ AI Planning Summary")
-
-        # --- Venue Details ---
-        if os.path.exists("venue_details.json"):
-            st.subheader("📍 Venue Details")
-            try:
-                with open("venue_details.json") as f:
-                    venue = json.load(f)
-                    st.markdown(f"""
-**🏢 Name:** {venue["name"]}  
-**📍 Address:** {venue["address"]}  
-**👥 Capacity:** {venue["capacity"]}  
-**📅 Booking Status:** {venue["booking_status"]}  
+
+# --- Results ---
+planner_future = st.session_state.get("planner_future")
+if planner_future is not None and not planner_future.done():
+    st.info("⏳ Running AI Agents...")
+    time.sleep(1)
+    st.rerun()
+elif planner_future is not None and planner_future.exception() is not None:
+    st.error(f"Error running AI agents: {planner_future.exception()}")
+elif planner_future is not None:
+    # Drawn from this run's own bytes, never from the shared files on disk.
+    files, summaries = planner_future.result()
+
+    st.success("🎉 Event Planning Completed")
+    st.markdown("### ✅ AI Planning Summary")
+
+    # --- Venue Details ---
+    raw = files.get("venue_details.json")
+    if raw:
+        st.subheader("📍 Venue Details")
+        try:
+            venue = msgspec.json.decode(raw, type=VenueRecord)
+            st.markdown(f"""
+**🏢 Name:** {venue.name}  
+**📍 Address:** {venue.address}  
+**👥 Capacity:** {venue.capacity}  
+**📅 Booking Status:** {venue.booking_status}  
 """)
-                    st.download_button(
-                        "⬇️ Download Venue JSON",
-                        json.dumps(venue, indent=2),
-                        file_name="venue_details.json",
-                    )
-            except Exception as e:
-                st.error(f"Error loading venue details: {e}")
-        else:
-            st.warning("⚠️ Venue details file not found or not properly generated.")
-
-        # --- Marketing Report ---
-        if os.path.exists("marketing_report.json"):
-            st.subheader("📣 Marketing Report")
-            try:
-                with open("marketing_report.json") as f:
-                    report = json.load(f)
-                    st.markdown(
-                        f"""
-📝 **Summary**: {report["summary"]}  
-📊 **Estimated Reach**: {report["estimated_reach"]}  
+            st.download_button(
+                "⬇️ Download Venue JSON",
+                raw,
+                file_name="venue_details.json",
+                mime="application/json",
+            )
+        except Exception as e:
+            st.error(f"Error loading venue details: {e}")
+    else:
+        st.warning("⚠️ Venue details file not found or not properly generated.")
+
+    # --- Marketing Report ---
+    raw = files.get("marketing_report.json")
+    if raw:
+        st.subheader("📣 Marketing Report")
+        try:
+            report = msgspec.json.decode(raw, type=MarketingRecord)
+            st.markdown(
+                f"""
+📝 **Summary**: {report.summary}  
+📊 **Estimated Reach**: {report.estimated_reach}  
 📌 **Campaigns**:  
 """
-                        + "\n".join(f"- {c}" for c in report["campaigns"])
-                    )
-                    st.download_button(
-                        "⬇️ Download Marketing Report",
-                        json.dumps(report, indent=2),
-                        file_name="marketing_report.json",
-                    )
-            except Exception as e:
-                st.error(f"Error loading marketing report: {e}")
-        else:
-            st.warning("⚠️ Marketing report file not found.")
-
-        # --- Optional: Agent Summaries ---
-        if "tasks_output" in result:
-            st.subheader("🧠 Agent Task Summaries")
-            for task in result["tasks_output"]:
-                if isinstance(task, str):
-                    continue
-                agent = task.get("agent", "Unknown")
-                desc = task.get("description", "")
-                summary = task.get("summary", "")
-                st.markdown(f"👤 **Agent:** {agent}")
-                st.markdown(f"📌 Task: {desc[:120]}...")
-                st.markdown(
-                    f"🧾 Summary: {summary if summary else 'No summary available.'}"
-                )
-                st.markdown("---")
+                + "\n".join(f"- {c}" for c in report.campaigns)
+            )
+            st.download_button(
+                "⬇️ Download Marketing Report",
+                raw,
+                file_name="marketing_report.json",
+                mime="application/json",
+            )
+        except Exception as e:
+            st.error(f"Error loading marketing report: {e}")
+    else:
+        st.warning("⚠️ Marketing report file not found.")
+
+    # --- Optional: Agent Summaries ---
+    if summaries:
+        st.subheader("🧠 Agent Task Summaries")
+        for agent, desc, summary in summaries:
+            agent = agent or "Unknown"
+            desc = desc or ""
+            st.markdown(
+                f"👤 **Agent:** {agent}\n\n"
+                f"📌 Task: {desc[:120]}...\n\n"
+                f"🧾 Summary: {summary if summary else 'No summary available.'}\n\n"
+                "---"
+            )